@@ -0,0 +1,505 @@
+"""
+Нагрузочный тест webhook-сервера (webhook_tickets.create_app) без выхода в интернет.
+
+Скрипт поднимает локальную заглушку api.telegram.org на aiohttp, направляет
+сессию бота на неё и отправляет в /webhook подписанные секретом апдейты
+(просмотр каталога, поиск, добавление в корзину, оформление заказа).
+В отчёте: устойчивый RPS, задержки end-to-end (от POST до завершения
+обработчика), исходящие вызовы Bot API на апдейт и рост памяти во времени.
+
+Сервер, заглушка и генератор нагрузки работают в одном процессе и делят
+одно ядро, поэтому полученный RPS - нижняя оценка для одного инстанса Render.
+
+Пример:
+    python loadtest_webhook.py --duration 60 --concurrency 50
+    python loadtest_webhook.py --rate 200 --api-latency 40 --mix browse=40,search=30,cart=20,checkout=10
+"""
+import argparse
+import asyncio
+import contextvars
+import gc
+import logging
+import math
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger("loadtest")
+
+FAKE_BOT_TOKEN = "123456789:LOADTEST-fake-token-for-offline-runs"
+DEFAULT_MIX = "browse=50,search=20,cart=20,checkout=10"
+SEARCH_MISSES = ["джаз", "выставка", "театр оперы"]
+
+# update_id апдейта, который сейчас обрабатывается (для подсчёта исходящих вызовов)
+current_update_id: contextvars.ContextVar = contextvars.ContextVar("current_update_id", default=None)
+
+
+def percentile(values, pct):
+    """Перцентиль по методу ближайшего ранга (values должен быть отсортирован)"""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[rank]
+
+
+# Без /proc (macOS, BSD) доступен только пиковый RSS, который не может уменьшаться
+RSS_IS_PEAK = not os.path.exists("/proc/self/statm")
+
+
+def current_rss_mb():
+    """RSS процесса в МБ: текущий на Linux, пиковый без /proc, None на Windows"""
+    if not RSS_IS_PEAK:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: на macOS в байтах, на Linux и BSD в килобайтах
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def format_mb(value, width=0):
+    return "н/д".rjust(width) if value is None else f"{value:{width}.1f}"
+
+
+def parse_mix(text):
+    """Разбор строки вида browse=50,search=20 в словарь весов"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("browse", "search", "cart", "checkout"):
+            raise argparse.ArgumentTypeError(f"Неизвестный сценарий: {name}")
+        if name in mix:
+            raise argparse.ArgumentTypeError(f"Сценарий указан дважды: {name}")
+        try:
+            value = float(weight)
+        except ValueError:
+            value = math.nan
+        if not (0 <= value < math.inf):
+            raise argparse.ArgumentTypeError(f"Некорректный вес для {name}: {weight!r}")
+        mix[name] = value
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("Сумма весов должна быть больше нуля")
+    return mix
+
+
+class Stats:
+    """Сбор результатов прогона"""
+
+    def __init__(self):
+        self.sent_at = {}            # update_id -> время отправки POST (при --rate - по расписанию)
+        self.measured = set()        # update_id, попадающие в замер (после прогрева)
+        self.outbound = Counter()    # update_id -> число исходящих вызовов
+        self.latencies = []          # end-to-end, секунды
+        self.ack_latencies = []      # время ответа webhook, секунды
+        self.send_lags = []          # отставание фактической отправки от расписания (--rate)
+        self.outbound_per_update = []
+        self.methods = Counter()     # вызовы Bot API по методам (за время замера)
+        self.scenarios = Counter()
+        self.checkout_users = {}     # update_id -> user_id для апдейтов оформления заказа
+        self.empty_checkouts = 0     # оформления, дошедшие до хендлера с пустой корзиной
+        self.checkouts_replaced = 0  # оформления, заменённые добавлением в корзину
+        self.completed = 0
+        self.handler_errors = 0
+        self.http_errors = Counter()
+        self.timeline = []
+        self.rss_before_warmup = None
+        self.rss_window_start = None  # RSS в момент начала замера
+
+
+class FakeTelegramAPI:
+    """Заглушка Bot API: отвечает правдоподобными объектами на любые методы"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    def _message(self, chat_id, text, message_id=None):
+        if message_id is None:
+            self._message_id += 1
+            message_id = self._message_id
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getme":
+            result = {"id": 123456789, "is_bot": True, "first_name": "LoadTestBot", "username": "loadtest_bot"}
+        elif method == "sendmessage":
+            result = self._message(int(data.get("chat_id", 0)), data.get("text", ""))
+        elif method == "editmessagetext" and "chat_id" in data:
+            result = self._message(
+                int(data["chat_id"]),
+                data.get("text", ""),
+                message_id=int(data.get("message_id", 0)),
+            )
+        else:
+            # answerCallbackQuery, setWebhook, deleteWebhook и т.п.
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+class UpdateFactory:
+    """Генерация апдейтов Telegram для сценариев нагрузки"""
+
+    def __init__(self, events):
+        self.events = events
+        self.queries = [e["venue"].lower() for e in events] + SEARCH_MISSES
+        self._update_id = 0
+
+    def next_id(self):
+        self._update_id += 1
+        return self._update_id
+
+    @staticmethod
+    def _user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+    def message(self, user_id, text):
+        update_id = self.next_id()
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text,
+            },
+        }
+
+    def callback(self, user_id, data):
+        update_id = self.next_id()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "text": "🎫 Главное меню",
+                },
+            },
+        }
+
+    def scenario(self, name, user_id):
+        """Апдейт для сценария: browse, search, cart или checkout"""
+        if name == "browse":
+            if random.random() < 0.5:
+                return self.callback(user_id, "events")
+            return self.callback(user_id, f"event_{random.choice(self.events)['id']}")
+        if name == "search":
+            return self.message(user_id, random.choice(self.queries))
+        if name == "cart":
+            return self.callback(user_id, f"add_cart_{random.choice(self.events)['id']}")
+        return self.callback(user_id, "checkout")
+
+
+def install_instrumentation(dp, bot, stats: Stats, user_cart):
+    """Замер завершения обработки апдейта и исходящих вызовов Bot API"""
+
+    async def update_timer(handler, event, data):
+        checkout_user = stats.checkout_users.pop(event.update_id, None)
+        if checkout_user is not None and not user_cart.get(checkout_user):
+            stats.empty_checkouts += 1
+        token = current_update_id.set(event.update_id)
+        error = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            error = True
+            raise
+        finally:
+            current_update_id.reset(token)
+            finished = time.perf_counter()
+            sent = stats.sent_at.pop(event.update_id, None)
+            calls = stats.outbound.pop(event.update_id, 0)
+            if event.update_id in stats.measured:
+                stats.measured.discard(event.update_id)
+                stats.completed += 1
+                stats.handler_errors += error
+                stats.outbound_per_update.append(calls)
+                if sent is not None:
+                    stats.latencies.append(finished - sent)
+
+    async def request_counter(make_request, bot, method):
+        update_id = current_update_id.get()
+        if update_id is not None:
+            stats.outbound[update_id] += 1
+            if update_id in stats.measured:
+                stats.methods[type(method).__name__] += 1
+        return await make_request(bot, method)
+
+    dp.update.outer_middleware(update_timer)
+    bot.session.middleware(request_counter)
+
+
+async def start_site(app: web.Application, **runner_kwargs):
+    runner = web.AppRunner(app, **runner_kwargs)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def run(args):
+    # Окружение задаётся до импорта: webhook_tickets читает его при загрузке
+    os.environ["BOT_TOKEN"] = FAKE_BOT_TOKEN
+    os.environ["WEBHOOK_HOST"] = ""
+    os.environ["WEBHOOK_SECRET"] = args.secret
+    from aiogram.client.telegram import TelegramAPIServer
+    import bot_tickets
+    import webhook_tickets
+
+    if not args.verbose:
+        for name in ("aiogram", "aiohttp.access", "bot_tickets", "webhook_tickets"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    stats = Stats()
+    fake_api = FakeTelegramAPI(latency=args.api_latency / 1000)
+    api_runner, api_url = await start_site(fake_api.create_app(), access_log=None)
+    webhook_tickets.bot.session.api = TelegramAPIServer.from_base(api_url)
+    install_instrumentation(webhook_tickets.dp, webhook_tickets.bot, stats, bot_tickets.user_cart)
+
+    app_runner, app_url = await start_site(webhook_tickets.create_app())
+    webhook_url = f"{app_url}{webhook_tickets.WEBHOOK_PATH}"
+    logger.info(f"Заглушка Bot API: {api_url}, webhook: {webhook_url}")
+
+    factory = UpdateFactory(bot_tickets.EVENTS)
+    names = list(args.mix)
+    weights = [args.mix[n] for n in names]
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret}
+
+    loop_start = time.perf_counter()
+    measure_start = loop_start + args.warmup
+    deadline = measure_start + args.duration
+    # При --rate каждый воркер держит свою долю целевого RPS
+    interval = args.concurrency / args.rate if args.rate else 0.0
+
+    async def worker(session: aiohttp.ClientSession, worker_no: int):
+        # Пул пользователей: у каждого своя корзина и свои билеты
+        first_user = 100000 + worker_no * args.users_per_worker
+        users = range(first_user, first_user + args.users_per_worker)
+        next_at = time.perf_counter() + random.random() * interval
+        while True:
+            scheduled = next_at
+            if interval:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_at += interval
+            now = time.perf_counter()
+            if now >= deadline:
+                return
+            # При --rate задержка считается от запланированного момента отправки,
+            # иначе очередь на стороне клиента не попадёт в перцентили
+            start = scheduled if interval else now
+            in_window = now >= measure_start
+            scenario = random.choices(names, weights)[0]
+            if scenario == "checkout":
+                # Оформляем заказ только тем, у кого корзина не пуста
+                with_cart = [u for u in users if bot_tickets.user_cart.get(u)]
+                if with_cart:
+                    user_id = random.choice(with_cart)
+                else:
+                    scenario = "cart"
+                    stats.checkouts_replaced += in_window
+            if scenario != "checkout":
+                user_id = random.choice(users)
+            update = factory.scenario(scenario, user_id)
+            update_id = update["update_id"]
+            if in_window:
+                stats.measured.add(update_id)
+                stats.scenarios[scenario] += 1
+                if interval:
+                    stats.send_lags.append(now - scheduled)
+                if scenario == "checkout":
+                    stats.checkout_users[update_id] = user_id
+            stats.sent_at[update_id] = start
+            try:
+                async with session.post(webhook_url, json=update, headers=headers) as resp:
+                    await resp.read()
+                    status = resp.status
+            except aiohttp.ClientError as e:
+                status = type(e).__name__
+            if status != 200:
+                stats.sent_at.pop(update_id, None)
+                stats.measured.discard(update_id)
+                stats.checkout_users.pop(update_id, None)
+                if in_window:
+                    stats.http_errors[status] += 1
+            elif in_window:
+                stats.ack_latencies.append(time.perf_counter() - start)
+
+    async def sampler():
+        prev_completed = 0
+        prev_time = measure_start
+        await asyncio.sleep(max(0.0, measure_start - time.perf_counter()))
+        # Базовая точка памяти - начало замера, а не прогрева
+        gc.collect()
+        stats.rss_window_start = current_rss_mb()
+        while True:
+            await asyncio.sleep(args.interval)
+            now = time.perf_counter()
+            completed = stats.completed
+            tickets = sum(len(t) for t in bot_tickets.user_tickets.values())
+            stats.timeline.append({
+                "t": now - measure_start,
+                "rps": (completed - prev_completed) / (now - prev_time),
+                "rss": current_rss_mb(),
+                "tickets": tickets,
+                "in_flight": len(stats.sent_at),
+            })
+            prev_completed, prev_time = completed, now
+
+    gc.collect()
+    stats.rss_before_warmup = current_rss_mb()
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    sampler_task = asyncio.create_task(sampler())
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*(worker(session, i) for i in range(args.concurrency)))
+        # Дожидаемся апдейтов, которые ещё обрабатываются в фоне
+        drain_deadline = time.perf_counter() + args.drain_timeout
+        while stats.measured and time.perf_counter() < drain_deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - measure_start
+    finally:
+        sampler_task.cancel()
+        await app_runner.cleanup()
+        await api_runner.cleanup()
+    gc.collect()
+    rss_end = current_rss_mb()
+
+    report(args, stats, fake_api, elapsed, rss_end)
+    return stats
+
+
+def report(args, stats: Stats, fake_api: FakeTelegramAPI, elapsed, rss_end):
+    latencies = sorted(stats.latencies)
+    acks = sorted(stats.ack_latencies)
+    outbound = stats.outbound_per_update
+    sent = sum(stats.scenarios.values())
+
+    print()
+    print("=" * 64)
+    print("Нагрузочный тест webhook_tickets.create_app")
+    print("=" * 64)
+    print(f"Параллельность: {args.concurrency}, целевой RPS: {args.rate or 'максимум'}, "
+          f"задержка Bot API: {args.api_latency} мс")
+    print(f"Длительность замера: {elapsed:.1f} с (прогрев {args.warmup} с)")
+    print("Сценарии: " + ", ".join(f"{k}={v}" for k, v in stats.scenarios.most_common()))
+    print(f"Оформления с пустой корзиной: {stats.empty_checkouts}, "
+          f"заменено добавлением в корзину (нет корзин): {stats.checkouts_replaced}")
+    print()
+    print(f"Отправлено апдейтов:  {sent}")
+    print(f"Обработано:           {stats.completed}")
+    print(f"Ошибок в хендлерах:   {stats.handler_errors}")
+    print(f"Не обработано:        {len(stats.measured)}")
+    if stats.http_errors:
+        print("HTTP-ошибки:          " + ", ".join(f"{k}: {v}" for k, v in stats.http_errors.items()))
+    if elapsed > 0:
+        print(f"Устойчивый RPS:       {stats.completed / elapsed:.1f}")
+    print()
+    rows = [("end-to-end", latencies), ("ответ webhook", acks)]
+    if args.rate:
+        rows.append(("отставание отпр.", sorted(stats.send_lags)))
+        print("При --rate задержки считаются от запланированного момента отправки")
+    print("Задержка, мс          p50      p90      p99      max")
+    for title, values in rows:
+        print(f"{title:<18}" + "".join(
+            f"{percentile(values, p) * 1000:9.1f}" for p in (50, 90, 99, 100)
+        ))
+    print()
+    if outbound:
+        print(f"Исходящих вызовов на апдейт: среднее {sum(outbound) / len(outbound):.2f}, "
+              f"макс {max(outbound)}")
+    print("Вызовы Bot API: " + ", ".join(f"{k}={v}" for k, v in stats.methods.most_common()))
+    print(f"Всего запросов в заглушку: {sum(fake_api.calls.values())}")
+    print()
+    rss_title = "пик RSS" if RSS_IS_PEAK else "RSS, МБ"
+    print(f"  время, с     RPS   {rss_title}   билетов   в работе")
+    for point in stats.timeline:
+        print(f"{point['t']:10.1f}{point['rps']:8.1f}{format_mb(point['rss'], 10)}"
+              f"{point['tickets']:10d}{point['in_flight']:11d}")
+    rss_start = stats.rss_window_start
+    if rss_start is None:
+        rss_start = stats.rss_before_warmup
+    print()
+    if rss_start is None or rss_end is None:
+        print("Память: RSS недоступен на этой платформе")
+        return
+    growth = rss_end - rss_start
+    per_min = growth / elapsed * 60 if elapsed > 0 else 0.0
+    kind = "пиковый RSS" if RSS_IS_PEAK else "RSS"
+    print(f"Память до прогрева ({kind}): {format_mb(stats.rss_before_warmup)} МБ")
+    print(f"Память за замер ({kind}): {rss_start:.1f} -> {rss_end:.1f} МБ "
+          f"({growth:+.1f} МБ, {per_min:+.1f} МБ/мин)")
+    if RSS_IS_PEAK:
+        print("Пиковый RSS не уменьшается: рост показывает новые максимумы, а не текущий расход")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook-сервера бота без выхода в интернет")
+    parser.add_argument("--duration", type=float, default=30, help="длительность замера, с")
+    parser.add_argument("--warmup", type=float, default=3, help="прогрев перед замером, с")
+    parser.add_argument("--concurrency", type=int, default=20, help="число параллельных клиентов")
+    parser.add_argument("--rate", type=float, default=0, help="целевой RPS (0 - максимально возможный)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"веса сценариев (по умолчанию {DEFAULT_MIX})")
+    parser.add_argument("--users-per-worker", type=int, default=50, help="пользователей на одного клиента")
+    parser.add_argument("--api-latency", type=float, default=0, help="задержка ответа заглушки Bot API, мс")
+    parser.add_argument("--interval", type=float, default=5, help="шаг таблицы RPS/памяти, с")
+    parser.add_argument("--drain-timeout", type=float, default=10, help="ожидание фоновых апдейтов в конце, с")
+    parser.add_argument("--secret", default="loadtest-secret", help="секрет webhook (X-Telegram-Bot-Api-Secret-Token)")
+    parser.add_argument("--seed", type=int, default=None, help="seed генератора сценариев")
+    parser.add_argument("--verbose", action="store_true", help="не приглушать логи aiogram/aiohttp")
+    args = parser.parse_args()
+    if args.concurrency < 1 or args.users_per_worker < 1:
+        parser.error("--concurrency и --users-per-worker должны быть положительными")
+    if not (0 < args.interval < math.inf):
+        parser.error("--interval должен быть положительным")
+    for option in ("rate", "duration", "warmup", "api_latency", "drain_timeout"):
+        if not (0 <= getattr(args, option) < math.inf):
+            parser.error(f"--{option.replace('_', '-')} должен быть неотрицательным числом")
+    if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", args.secret):
+        parser.error("--secret: допустимы только A-Z, a-z, 0-9, _ и -, длина 1-256")
+
+    logging.basicConfig(level=logging.INFO)
+    if args.seed is not None:
+        random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
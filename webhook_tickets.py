@@ -21,6 +21,8 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "")  # URL вашего приложения на Render
 WEBHOOK_PATH = "/webhook"
 WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}"
+# Секрет, которым Telegram подписывает запросы (заголовок X-Telegram-Bot-Api-Secret-Token)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
 
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не найден!")
@@ -31,7 +33,7 @@ bot = Bot(token=BOT_TOKEN)
 async def on_startup(bot: Bot) -> None:
     """Установка webhook при запуске"""
     if WEBHOOK_HOST:
-        await bot.set_webhook(WEBHOOK_URL)
+        await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
         logger.info(f"Webhook установлен: {WEBHOOK_URL}")
     else:
         logger.warning("WEBHOOK_HOST не установлен, webhook не будет настроен")
@@ -52,6 +54,7 @@ def create_app() -> web.Application:
     webhook_requests_handler = SimpleRequestHandler(
         dispatcher=dp,
         bot=bot,
+        secret_token=WEBHOOK_SECRET,
     )
     webhook_requests_handler.register(app, path=WEBHOOK_PATH)
     